@@ -1,14 +1,17 @@
 import os
 from pathlib import Path
 import sys
-import pandas as pd
-import random
+import numpy as np
 import json
+import csv
 
 
 ALPHABET = ["A", "C", "G", "T"]
+ALPHABET_BYTES = np.frombuffer("".join(ALPHABET).encode(), dtype=np.uint8)
 SEED = 42
 
+RNG = np.random.default_rng(SEED)
+
 DEFAULT_RANGES = {
     "motif": (2, 6),
     "seq": (10, 100),
@@ -19,16 +22,21 @@ N_SMALL = 10
 N_LARGE = 1000
 N_XLARGE = 10000
 
+# directories already created by generate_files, to skip repeat makedirs calls
+_ENSURED_DIRS = set()
+
 
 def random_seq(length, alphabet, allow_homopolymer=True):
     """
     Generate a random sequence of length n with given alphabet.
     Ensures that resulting sequence is not a homopolymer.
     """
+    alphabet = np.asarray(alphabet)
     if length >= 2 and not allow_homopolymer:
-        motif = random.sample(alphabet, 2) + random.choices(alphabet, k=length - 2)
+        first = RNG.choice(alphabet, size=2, replace=False)
+        motif = np.concatenate([first, RNG.choice(alphabet, size=length - 2)])
     else:
-        motif = random.choices(alphabet, k=length)
+        motif = RNG.choice(alphabet, size=length)
     return "".join(motif)
 
 
@@ -46,7 +54,7 @@ def repeat_seq(motif, n, rotate=True):
     n_repeat = n // len(motif) + 1
     seq = motif * n_repeat
     if rotate:
-        rotate_n = random.randint(0, len(motif) - 1)
+        rotate_n = int(RNG.integers(0, len(motif)))
         seq = rotate_seq(seq, rotate_n)
     return seq[:n]
 
@@ -59,9 +67,9 @@ def simulate_repeat_seq(
     intersect_alpha=None,
     rotate=True,
 ):
-    motif_len = random.randint(*motif_len_range)
-    seq_len = random.randint(*seq_len_range)
-    intrpt_len = random.randint(*intrpt_len_range)
+    motif_len = int(RNG.integers(motif_len_range[0], motif_len_range[1] + 1))
+    seq_len = int(RNG.integers(seq_len_range[0], seq_len_range[1] + 1))
+    intrpt_len = int(RNG.integers(intrpt_len_range[0], intrpt_len_range[1] + 1))
 
     # if true,
     if intersect_alpha is None or intersect_alpha:
@@ -69,8 +77,8 @@ def simulate_repeat_seq(
         intrpt_alpha = ALPHABET
     else:
         # the motif and interruption sequences are generated from disjoint alphabets
-        motif_alpha_len = random.randint(2, len(ALPHABET) - 1)
-        motif_alpha = random.sample(ALPHABET, motif_alpha_len)
+        motif_alpha_len = int(RNG.integers(2, len(ALPHABET)))
+        motif_alpha = list(RNG.choice(ALPHABET, size=motif_alpha_len, replace=False))
         intrpt_alpha = [x for x in ALPHABET if x not in motif_alpha]
 
     # generate repeat sequence
@@ -82,11 +90,11 @@ def simulate_repeat_seq(
 
     # generate interruption sequence and position
     intrpt = random_seq(intrpt_len, intrpt_alpha)
-    intrpt_pos = random.randint(1, len(seq) - len(intrpt) - 1)
+    intrpt_pos = int(RNG.integers(1, len(seq) - len(intrpt)))
 
     # if insert is not specified, randomly choose whether to insert or substitute
     if insert is None:
-        insert = bool(random.getrandbits(1))
+        insert = bool(RNG.integers(0, 2))
 
     if insert:
         # insert the interruption sequence into the repeat sequence
@@ -105,57 +113,150 @@ def simulate_repeat_seq(
     return motif, intrpt, intrpt_seq
 
 
+def simulate_batch(
+    n,
+    motif_len_range=DEFAULT_RANGES["motif"],
+    seq_len_range=DEFAULT_RANGES["seq"],
+    intrpt_len_range=DEFAULT_RANGES["intrpt"],
+    insert=None,
+    intersect_alpha=None,
+    rotate=True,
+):
+    """
+    Simulate `n` repeat sequences at once. All random values (lengths,
+    alphabets, character indices, rotations, positions) are drawn in
+    batched NumPy calls up front, so the per-sequence assembly loop does
+    no RNG work of its own. Sequences are assembled as bytes and decoded
+    to str once at the end.
+    """
+    n_alpha = len(ALPHABET)
+
+    motif_lens = RNG.integers(motif_len_range[0], motif_len_range[1] + 1, size=n)
+    seq_lens = RNG.integers(seq_len_range[0], seq_len_range[1] + 1, size=n)
+    intrpt_lens = RNG.integers(intrpt_len_range[0], intrpt_len_range[1] + 1, size=n)
+
+    # one alphabet permutation per sequence; the motif alphabet is a prefix
+    # of the permutation and (for disjoint alphabets) the interruption
+    # alphabet is the complementary suffix
+    alpha_perms = RNG.permuted(np.tile(np.arange(n_alpha), (n, 1)), axis=1)
+    if intersect_alpha is None or intersect_alpha:
+        motif_alpha_lens = np.full(n, n_alpha)
+    else:
+        motif_alpha_lens = RNG.integers(2, n_alpha, size=n)
+
+    # uniform draws that get mapped onto per-sequence alphabets below
+    motif_u = RNG.random((n, motif_lens.max()))
+    intrpt_u = RNG.random((n, max(intrpt_lens.max(), 1)))
+    rotate_u = RNG.random(n)
+    pos_u = RNG.random(n)
+
+    if insert is None:
+        inserts = RNG.integers(0, 2, size=n).astype(bool)
+    else:
+        inserts = np.full(n, insert, dtype=bool)
+
+    repeat_seqs = []
+    for i in range(n):
+        motif_len = motif_lens[i]
+        seq_len = seq_lens[i]
+        intrpt_len = intrpt_lens[i]
+
+        k = motif_alpha_lens[i]
+        motif_alpha = ALPHABET_BYTES[alpha_perms[i, :k]]
+
+        # map uniform draws to character indices; make the first two
+        # characters distinct so the motif is not a homopolymer
+        idx = (motif_u[i, :motif_len] * k).astype(int)
+        if motif_len >= 2 and k >= 2:
+            idx[1] = (idx[0] + 1 + int(motif_u[i, 1] * (k - 1))) % k
+        motif = motif_alpha[idx].tobytes()
+
+        # generate repeat sequence
+        n_repeat = seq_len // motif_len + 1
+        seq = motif * n_repeat
+        if rotate:
+            rotate_n = int(rotate_u[i] * motif_len)
+            seq = rotate_seq(seq, rotate_n)
+        seq = seq[:seq_len]
+
+        if intersect_alpha is None:
+            intrpt_alpha = ALPHABET_BYTES
+        elif intersect_alpha:
+            intrpt_alpha = np.frombuffer(bytes(sorted(set(motif))), dtype=np.uint8)
+        else:
+            intrpt_alpha = ALPHABET_BYTES[alpha_perms[i, k:]]
+
+        # generate interruption sequence and position
+        idx = (intrpt_u[i, :intrpt_len] * len(intrpt_alpha)).astype(int)
+        intrpt = intrpt_alpha[idx].tobytes()
+        intrpt_pos = 1 + int(pos_u[i] * (len(seq) - intrpt_len - 1))
+
+        if inserts[i]:
+            # insert the interruption sequence into the repeat sequence
+            intrpt_seq = seq[:intrpt_pos] + intrpt + seq[intrpt_pos:]
+            intrpt_seq = intrpt_seq[:seq_len]
+        else:
+            # substitute the interruption sequence for a portion of the repeat sequence
+            intrpt_seq = seq[:intrpt_pos] + intrpt + seq[intrpt_len + intrpt_pos :]
+
+        if not inserts[i] and intrpt == seq[intrpt_pos : intrpt_pos + intrpt_len]:
+            # if the interruption sequence is the same as sequence
+            # it is substituting, set the interruption sequence to be empty
+            # since there will not be an interruption technically
+            intrpt = b""
+
+        # decode back to str only once the sequence is fully assembled
+        repeat_seqs.append((motif.decode(), intrpt.decode(), intrpt_seq.decode()))
+
+    return repeat_seqs
+
+
 def generate_files(repeat_seqs, dir_path, prefix):
     motifs = [x[0] for x in repeat_seqs]
     intrpts = [x[1] for x in repeat_seqs]
     seqs = [x[2] for x in repeat_seqs]
 
-    # create output directory
-    os.makedirs(dir_path / prefix, exist_ok=True)
+    # create output directory (once per unique directory)
+    out_dir = dir_path / prefix
+    if out_dir not in _ENSURED_DIRS:
+        os.makedirs(out_dir, exist_ok=True)
+        _ENSURED_DIRS.add(out_dir)
 
     # create file paths
     truth_path = dir_path / prefix / f"{prefix}.truth.tsv"
     repeat_seqs_path = dir_path / prefix / f"{prefix}.repeat_seqs.tsv"
     str_catalog_path = dir_path / prefix / f"{prefix}.str_catalog.json"
 
-    # create truth dataframe
-    df = pd.DataFrame(
-        {
-            "locus_id": range(len(repeat_seqs)),
-            "motif": motifs,
-            "interruption": intrpts,
-            "seq": seqs,
-        }
-    )
-
     # write truth file
-    df.to_csv(truth_path, index=False, sep="\t")
+    with open(truth_path, "w", newline="", buffering=1 << 20) as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(["locus_id", "motif", "interruption", "seq"])
+        writer.writerows(zip(range(len(repeat_seqs)), motifs, intrpts, seqs))
 
     # write repeat_seqs file for tool input
-    df[["locus_id", "seq"]].to_csv(repeat_seqs_path, index=False, sep="\t", header=None)
+    with open(repeat_seqs_path, "w", newline="", buffering=1 << 20) as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerows(zip(range(len(repeat_seqs)), seqs))
 
     # create str_catalog file for tool input
-    str_catalog = []
-    for _, row in df.iterrows():
-        motif = row["motif"]
-        str_catalog.append(
-            {"LocusId": str(row["locus_id"]), "LocusStructure": f"({motif})*"}
-        )
+    str_catalog = [
+        {"LocusId": str(i), "LocusStructure": f"({motif})*"}
+        for i, motif in enumerate(motifs)
+    ]
 
     # write str_catalog file
     with open(str_catalog_path, "w") as f:
-        json.dump(str_catalog, f, indent=4)
+        json.dump(str_catalog, f)
 
 
 def generate_dataset(n, prefix, prefixes, dir_path, **kwargs):
-    repeat_seqs = [simulate_repeat_seq(**kwargs) for _ in range(n)]
+    repeat_seqs = simulate_batch(n, **kwargs)
     generate_files(repeat_seqs, dir_path, prefix)
     prefixes.append(prefix)
     print(f"Generated {prefix} dataset")
 
 
 def main():
-    random.seed(SEED)
     dir_path = Path(sys.argv[1])
 
     prefixes = []
@@ -4,6 +4,18 @@ import pandas as pd
 import sys
 
 
+STRIF_BIN = Path(__file__).resolve().parent.parent / "target" / "release" / "strif"
+
+
+def build_strif():
+    """
+    Compile the release binary once up front so run_command can invoke it
+    directly instead of paying cargo's dependency check on every call.
+    """
+    subprocess.run("cargo build --release", shell=True, check=True)
+    return STRIF_BIN
+
+
 def run_command(
     repeat_seqs,
     str_catalog,
@@ -14,7 +26,15 @@ def run_command(
     gap_extend_score=None,
     visualize=False,
 ):
-    command = f"cargo run --release -- profile {repeat_seqs} {str_catalog} {output}"
+    # with output "-", the profile is captured from stdout and returned
+    # instead of being written to disk
+    capture = output == "-"
+    if capture:
+        output = "/dev/stdout"
+    if STRIF_BIN.exists():
+        command = f"{STRIF_BIN} profile {repeat_seqs} {str_catalog} {output}"
+    else:
+        command = f"cargo run --release -- profile {repeat_seqs} {str_catalog} {output}"
     if match_score is not None:
         command += f" -A={match_score}"
     if mismatch_score is not None:
@@ -25,13 +45,20 @@ def run_command(
         command += f" -E={gap_extend_score}"
     if visualize:
         command += " -z"
-    subprocess.run(command, shell=True, stderr=subprocess.DEVNULL)
+    result = subprocess.run(
+        command,
+        shell=True,
+        stderr=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if capture else None,
+    )
+    if capture:
+        return command, result.stdout
     return command
 
 
 def create_stat_df(truth_path, profile_path):
-    truth = pd.read_csv(truth_path, sep="\t")
-    profile = pd.read_csv(profile_path, sep="\t")
+    truth = pd.read_csv(truth_path, sep="\t", engine="pyarrow")
+    profile = pd.read_csv(profile_path, sep="\t", engine="pyarrow")
 
     truth = truth.rename(columns={"interruption": "true_interruption"})
     profile = profile.rename(columns={"interruption": "pred_interruption"})
@@ -44,9 +71,12 @@ def create_stat_df(truth_path, profile_path):
     merged["exact_match"] = merged["exact_match"].astype(int)
 
     # inexact match is true if true interruption is a substring of predicted interruption
-    merged["inexact_match"] = merged.apply(
-        lambda row: row["true_interruption"] in row["pred_interruption"], axis=1
-    )
+    merged["inexact_match"] = [
+        true in pred
+        for true, pred in zip(
+            merged["true_interruption"].to_numpy(), merged["pred_interruption"].to_numpy()
+        )
+    ]
     merged["inexact_match"] = merged["inexact_match"].astype(int)
 
     return merged
@@ -96,6 +126,8 @@ def main():
 
     overall_stats = []
 
+    build_strif()
+
     # run tool on each prefix
     for prefix in prefixes:
         # don't run test sets if not specified
@@ -1,65 +1,59 @@
-import errno
 import os
 import sys
-from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 from pathlib import Path
-import time
 
 import pandas as pd
-from metrics import compute_metrics, create_stat_df, run_command
+from metrics import build_strif, compute_metrics, create_stat_df, run_command
 
 CORES = 10
 
+# number of result rows each child buffers in memory before writing
+WRITE_BUFFER_ROWS = 64
+
 MATCH_SCORE_RANGE = list(range(1, 2))
 MISMATCH_PENALTY_RANGE = list(range(1, 11))
 GAP_OPEN_PENALTY_RANGE = list(range(1, 11))
 GAP_EXTEND_PENALTY_RANGE = list(range(1, 11))
 
 
-def start_process(id, params, valid_dir_path, prefix, tmp_dir_path, results_file):
-    pid = os.fork()
-    if pid == 0:
-        print(f"[Process {id}] Starting...", flush=True)
+def run_batch(id, params, valid_dir_path, prefix, part_path):
+    print(f"[Worker {id}] Starting...", flush=True)
 
-        truth_path = valid_dir_path / prefix / f"{prefix}.truth.tsv"
-        repeat_seqs_path = valid_dir_path / prefix / f"{prefix}.repeat_seqs.tsv"
-        str_catalog_path = valid_dir_path / prefix / f"{prefix}.str_catalog.json"
+    truth_path = valid_dir_path / prefix / f"{prefix}.truth.tsv"
+    repeat_seqs_path = valid_dir_path / prefix / f"{prefix}.repeat_seqs.tsv"
+    str_catalog_path = valid_dir_path / prefix / f"{prefix}.str_catalog.json"
 
-        for i, (m, x, g, e) in enumerate(params):
-            profile_path = tmp_dir_path / prefix / f"{prefix}_proc{id}_{i}.tmp"
+    # each worker owns its part file, buffering rows in memory so the hot
+    # loop does not pay a write + flush per parameter combination
+    results_file = open(part_path, "w")
+    buffer = []
 
-            if i % 100 == 0:
-                percent_complete = int(i / len(params) * 100)
-                print(f"[Process {id}] {percent_complete}%", flush=True)
+    for i, (m, x, g, e) in enumerate(params):
+        if i % 100 == 0:
+            percent_complete = int(i / len(params) * 100)
+            print(f"[Worker {id}] {percent_complete}%", flush=True)
 
-            cmd = run_command(
-                repeat_seqs_path, str_catalog_path, profile_path, m, x, g, e
-            )
-            time.sleep(0.01)
+        # capture the profile from stdout; it never touches the filesystem
+        cmd, profile = run_command(repeat_seqs_path, str_catalog_path, "-", m, x, g, e)
 
-            try:
-                stat_df = create_stat_df(truth_path, profile_path)
-                metrics = "\t".join([str(m) for m in compute_metrics(stat_df)])
-                results_file.write(f"{m}\t{x}\t{g}\t{e}\t{metrics}\n")
+        try:
+            stat_df = create_stat_df(truth_path, BytesIO(profile))
+            metrics = "\t".join([str(m) for m in compute_metrics(stat_df)])
+            buffer.append(f"{m}\t{x}\t{g}\t{e}\t{metrics}\n")
+            if len(buffer) >= WRITE_BUFFER_ROWS:
+                results_file.write("".join(buffer))
                 results_file.flush()
-            except OSError as e:
-                if e.errno != errno.ENOENT:
-                    raise
-                print(f"[Process {id}] Failed to run command: {cmd}", flush=True)
-
-            # delete profile file
-            try:
-                os.remove(profile_path)
-            except OSError as e:
-                if e.errno != errno.ENOENT:
-                    raise
-
-        # when finished, exit the child process
-        print(f"[Process {id}] Finished", flush=True)
-        results_file.close()
-        exit(0)
-    else:
-        return pid
+                buffer.clear()
+        except (pd.errors.EmptyDataError, pd.errors.ParserError):
+            print(f"[Worker {id}] Failed to run command: {cmd}", flush=True)
+
+    # when finished, write any remaining rows
+    if buffer:
+        results_file.write("".join(buffer))
+    results_file.close()
+    print(f"[Worker {id}] Finished", flush=True)
 
 
 def sort_results(unsorted_file_path, sorted_file_path):
@@ -82,29 +76,42 @@ def sort_results(unsorted_file_path, sorted_file_path):
     os.remove(unsorted_file_path)
 
 
-def perform_param_grid_search(params, valid_dir_path, prefix, tmp_dir_path, cores):
+def perform_param_grid_search(params, valid_dir_path, prefix, cores):
     print(f"Testing {len(params)} combinations using {cores} cores...")
 
-    with open(
-        valid_dir_path / prefix / f"{prefix}.param_search.unsorted.tsv", "w"
-    ) as f:
+    # build once in the parent so workers call the binary directly
+    build_strif()
+
+    # deal parameters out round-robin so expensive combinations spread
+    # evenly across workers instead of clustering in one contiguous batch
+    batches = [params[i::cores] for i in range(cores)]
+
+    # run each batch in its own worker process, writing to its own part file
+    part_paths = []
+    with ProcessPoolExecutor(max_workers=cores) as executor:
+        futures = []
+        for i, batch in enumerate(batches):
+            part_path = valid_dir_path / prefix / f"{prefix}.param_search.part{i + 1}.tsv"
+            part_paths.append(part_path)
+            futures.append(
+                executor.submit(run_batch, i + 1, batch, valid_dir_path, prefix, part_path)
+            )
+        for future in futures:
+            future.result()
+
+    # merge the part files into the unsorted results file
+    results_path = valid_dir_path / prefix / f"{prefix}.param_search.unsorted.tsv"
+    with open(results_path, "w") as f:
         f.write(
             "match_score\tmismatch_penalty\tgap_open_penalty\tgap_extend_penalty\texact_precision\texact_recall\tinexact_precision\tinexact_recall\n"
         )
-        f.flush()
-
-        batch_size = len(params) // cores + 1
-
-        for i in range(cores):
-            start_idx = i * batch_size
-            batch = params[start_idx : start_idx + batch_size]
-            start_process(i + 1, batch, valid_dir_path, prefix, tmp_dir_path, f)
-
-    for _ in range(cores):
-        os.wait()
+        for part_path in part_paths:
+            with open(part_path) as part:
+                f.write(part.read())
+            os.remove(part_path)
 
     sort_results(
-        valid_dir_path / prefix / f"{prefix}.param_search.unsorted.tsv",
+        results_path,
         valid_dir_path / prefix / f"{prefix}.param_search.tsv",
     )
 
@@ -112,22 +119,21 @@ def perform_param_grid_search(params, valid_dir_path, prefix, tmp_dir_path, core
 
 
 def main():
-    params = list(
-        product(
-            MATCH_SCORE_RANGE,
-            MISMATCH_PENALTY_RANGE,
-            GAP_OPEN_PENALTY_RANGE,
-            GAP_EXTEND_PENALTY_RANGE,
-        )
-    )
-
-    # remove params where gap_open_penalty < gap_extend_penalty
-    params = [(m, x, g, e) for m, x, g, e in params if x > m and g > e]
+    # enumerate only the valid combinations (mismatch > match,
+    # gap open > gap extend) instead of filtering the full product
+    params = [
+        (m, x, g, e)
+        for m in MATCH_SCORE_RANGE
+        for x in MISMATCH_PENALTY_RANGE
+        if x > m
+        for g in GAP_OPEN_PENALTY_RANGE
+        for e in GAP_EXTEND_PENALTY_RANGE
+        if g > e
+    ]
 
     valid_dir_path = Path(sys.argv[1])
-    tmp_dir_path = valid_dir_path
     prefix = sys.argv[2]
-    perform_param_grid_search(params, valid_dir_path, prefix, tmp_dir_path, CORES)
+    perform_param_grid_search(params, valid_dir_path, prefix, CORES)
 
 
 if __name__ == "__main__":
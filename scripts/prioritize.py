@@ -1,31 +1,58 @@
 import argparse
-from collections import defaultdict
+import os
 
 import pandas as pd
+import pyarrow.csv
 import scipy.stats
 import numpy as np
-from numpy import mean, sqrt, std
 from tqdm.auto import tqdm
 
 
-def cohen_d(cases, controls):
+def cohen_d(cases, controls, axis=-1):
     """
+    Computed along `axis`, so stacking units row-wise gives every
+    Cohen's d for a locus in one broadcast expression.
+
     Source: https://stackoverflow.com/questions/21532471/how-to-calculate-cohens-d-in-python
     """
-    nx = len(cases)
-    ny = len(controls)
+    cases = np.asarray(cases)
+    controls = np.asarray(controls)
+    nx = cases.shape[axis]
+    ny = controls.shape[axis]
     dof = nx + ny - 2
-    return (mean(cases) - mean(controls)) / sqrt(
-        ((nx - 1) * std(cases, ddof=1) ** 2 + (ny - 1) * std(controls, ddof=1) ** 2)
-        / dof
-    )
+    pooled_var = (
+        (nx - 1) * cases.std(axis=axis, ddof=1) ** 2
+        + (ny - 1) * controls.std(axis=axis, ddof=1) ** 2
+    ) / dof
+    return (cases.mean(axis=axis) - controls.mean(axis=axis)) / np.sqrt(pooled_var)
 
 
-def file_len(fname):
-    with open(fname) as f:
-        for i, _ in enumerate(f):
-            pass
-    return i + 1
+def avg_line_bytes(fname, sample_lines=100):
+    """
+    Average length in bytes of the first `sample_lines` lines of a file.
+    """
+    sampled_lines = 0
+    sampled_bytes = 0
+    with open(fname, "rb") as f:
+        for line in f:
+            sampled_lines += 1
+            sampled_bytes += len(line)
+            if sampled_lines >= sample_lines:
+                break
+    if sampled_lines == 0:
+        return 0.0
+    return sampled_bytes / sampled_lines
+
+
+def estimate_file_len(fname, sample_lines=100):
+    """
+    Estimate the number of lines in a file from its size and the average
+    length of its first `sample_lines` lines, without reading it all.
+    """
+    line_bytes = avg_line_bytes(fname, sample_lines)
+    if line_bytes == 0:
+        return 0
+    return round(os.path.getsize(fname) / line_bytes)
 
 
 def main():
@@ -79,9 +106,16 @@ def main():
     chunk_size = args.chunk_size
     progress_bar = args.no_progress
 
-    # Load merged profile
-    merged_profile = pd.read_csv(merged_profile_path, sep="\t", chunksize=chunk_size)
-    num_chunks = int((file_len(merged_profile_path) - 1) / chunk_size + 1)
+    # Load merged profile with Arrow's multi-threaded CSV reader, sizing
+    # blocks so each record batch holds roughly chunk_size rows
+    block_size = max(round(chunk_size * avg_line_bytes(merged_profile_path)), 1 << 16)
+    reader = pyarrow.csv.open_csv(
+        merged_profile_path,
+        read_options=pyarrow.csv.ReadOptions(block_size=block_size),
+        parse_options=pyarrow.csv.ParseOptions(delimiter="\t"),
+    )
+    merged_profile = (batch.to_pandas() for batch in reader)
+    num_chunks = int((estimate_file_len(merged_profile_path) - 1) / chunk_size + 1)
 
     if paired_test:
         print("Paired test enabled")
@@ -91,7 +125,24 @@ def main():
     n_skipped_interruptions = 0
     n_skipped_loci = 0
 
-    output = []
+    # Columnar output buffers: one list per field instead of a list of
+    # per-row tuples, so the final DataFrame is built without re-boxing
+    output = {
+        "locus_id": [],
+        "reference_region": [],
+        "motif": [],
+        "interruption": [],
+        "n_case": [],
+        "n_control": [],
+        "p_value": [],
+        "cohen_d": [],
+        "read_counts": [],
+        "interruption_counts": [],
+    }
+
+    # Cache of (case, control) donor lists -> sorted paired intersection,
+    # since the same cohort recurs across many loci
+    paired_donors_cache = {}
 
     for chunk in tqdm(
         merged_profile,
@@ -100,94 +151,186 @@ def main():
         position=0,
         disable=progress_bar,
     ):
+        # Parse every read_counts entry in the chunk in one pass of
+        # vectorized string ops instead of splitting per entry in Python
+        rc = chunk["read_counts"].str.split(",").explode()
+
+        # We exclude loci that do not have enough samples included
+        # We do an initial check here to avoid unnecessary computation
+        n_samples = rc.groupby(level=0).size()
+        enough_samples = n_samples >= min_samples * 2
+        if not enough_samples.any():
+            # every locus in this chunk fails the sample filter; splitting
+            # the now-empty frame with expand=True would produce no columns
+            n_skipped_loci += len(chunk)
+            continue
+        rc = rc[enough_samples[rc.index].values]
+
+        rc = rc.str.split(":", expand=True)
+        rc.columns = ["sample_id", "count"]
+        sample_id = rc["sample_id"].str.split("_", expand=True)
+        rc["donor_id"] = sample_id[0]
+        rc["status"] = sample_id[1]
+
+        unknown = ~rc["status"].isin(["case", "control"])
+        if unknown.any():
+            raise Exception(f"Unknown sample status: {rc['sample_id'][unknown].iloc[0]}")
+
+        duplicated = rc.reset_index().duplicated(["index", "status", "donor_id"])
+        if duplicated.any():
+            dup = rc[duplicated.values]
+            raise Exception(f"Duplicate {dup['status'].iloc[0]} sample: {dup['sample_id'].iloc[0]}")
+
+        # We find the donors that are included in the analysis of each locus by
+        # looking at which samples have read counts
+        case_donors_map = rc[rc["status"] == "case"].groupby(level=0)["donor_id"].agg(list)
+        control_donors_map = rc[rc["status"] == "control"].groupby(level=0)["donor_id"].agg(list)
+
+        # Decide up front which loci reach the statistics, so that only
+        # their interruption_counts entries are ever parsed and validated;
+        # loci skipped for donor counts must not be able to fail parsing
+        donors_by_locus = {}
+        for row_idx in enough_samples.index[enough_samples]:
+            case_donors = case_donors_map.get(row_idx, [])
+            control_donors = control_donors_map.get(row_idx, [])
+
+            # If we're doing a paired test, exclude donors that do not have a paired case/control sample
+            if paired_test:
+                cache_key = (tuple(case_donors), tuple(control_donors))
+                paired_donors = paired_donors_cache.get(cache_key)
+                if paired_donors is None:
+                    paired_donors = sorted(set(case_donors).intersection(control_donors))
+                    paired_donors_cache[cache_key] = paired_donors
+                case_donors = paired_donors
+                control_donors = paired_donors
+            else:
+                case_donors = sorted(case_donors)
+                control_donors = sorted(control_donors)
+
+            # We skip loci that do not have enough donors included
+            if len(case_donors) < min_samples or len(control_donors) < min_samples:
+                continue
+
+            donors_by_locus[row_idx] = (case_donors, control_donors)
+
+        # Parse the interruption_counts column the same way, restricted to
+        # the loci that survived the donor filtering above
+        ic = chunk["interruption_counts"].str.split(",").explode()
+        ic = ic[ic.index.isin(list(donors_by_locus))]
+        ic = ic[ic != ""]
+        if len(ic):
+            ic = ic.str.split(":", expand=True)
+            ic.columns = ["sample_id", "intrpt_unit", "count"]
+            sample_id = ic["sample_id"].str.split("_", expand=True)
+            ic["donor_id"] = sample_id[0]
+            ic["status"] = sample_id[1]
+            ic["count"] = ic["count"].astype(float)
+
+            unknown = ~ic["status"].isin(["case", "control"])
+            if unknown.any():
+                raise Exception("Unknown sample status: {}".format(ic["sample_id"][unknown].iloc[0]))
+
+            ic_groups = {row_idx: group for row_idx, group in ic.groupby(level=0)}
+        else:
+            ic_groups = {}
+
         # Loop over the loci in the merged profile chunk
-        for _, row in tqdm(
-            chunk.iterrows(),
+        for row in tqdm(
+            chunk.itertuples(),
             total=len(chunk),
             desc="Loci",
             position=1,
             leave=False,
             disable=progress_bar,
         ):
-            # We exclude loci that do not have enough samples included
-            # We do an initial check here to avoid unnecessary computation
-            read_counts = row["read_counts"].split(",")
-            if len(read_counts) < min_samples * 2:
+            donors = donors_by_locus.get(row.Index)
+            if donors is None:
                 n_skipped_loci += 1
                 continue
+            case_donors, control_donors = donors
 
-            # We find the donors that are included in the analysis of this locus by
-            # looking at which samples have read counts
-            case_donors = []
-            control_donors = []
+            entries = ic_groups.get(row.Index)
+            if entries is None:
+                continue
+
+            # Map donors to contiguous column indices
+            case_idx = {d: i for i, d in enumerate(case_donors)}
+            control_idx = {d: i for i, d in enumerate(control_donors)}
 
-            for entry in read_counts:
-                sample_id, count = entry.split(":")
-                donor_id, status = sample_id.split("_")
+            # Keep only entries from donors included at this locus
+            donor_ids = entries["donor_id"].to_numpy()
+            statuses = entries["status"].to_numpy()
+            units = entries["intrpt_unit"].to_numpy()
+            counts = entries["count"].to_numpy()
 
+            include = ((statuses == "case") & np.isin(donor_ids, case_donors)) | (
+                (statuses == "control") & np.isin(donor_ids, control_donors)
+            )
+            donor_ids = donor_ids[include]
+            statuses = statuses[include]
+            units = units[include]
+            counts = counts[include]
+
+            # First pass: assign a contiguous row to each interruption unit
+            unit_ids = {}
+            for intrpt_unit in units:
+                if intrpt_unit not in unit_ids:
+                    unit_ids[intrpt_unit] = len(unit_ids)
+
+            intrp_units_to_skip = set(units[~np.isfinite(counts) | (counts < 0)])
+
+            # Second pass: fill one (unit, donor) count matrix per status;
+            # filled marks cells with an observed count so missing donors
+            # keep their implicit integer zero in the output
+            case_arr = np.zeros((len(unit_ids), len(case_donors)))
+            control_arr = np.zeros((len(unit_ids), len(control_donors)))
+            case_filled = np.zeros(case_arr.shape, dtype=bool)
+            control_filled = np.zeros(control_arr.shape, dtype=bool)
+
+            for donor_id, status, intrpt_unit, count in zip(
+                donor_ids, statuses, units, counts
+            ):
+                unit_id = unit_ids[intrpt_unit]
                 if status == "case":
-                    if donor_id in case_donors:
-                        raise Exception(f"Duplicate case sample: {sample_id}")
-                    case_donors.append(donor_id)
-                elif status == "control":
-                    if donor_id in control_donors:
-                        raise Exception(f"Duplicate control sample: {sample_id}")
-                    control_donors.append(donor_id)
+                    case_arr[unit_id, case_idx[donor_id]] = count
+                    case_filled[unit_id, case_idx[donor_id]] = True
                 else:
-                    raise Exception(f"Unknown sample status: {sample_id}")
+                    control_arr[unit_id, control_idx[donor_id]] = count
+                    control_filled[unit_id, control_idx[donor_id]] = True
 
-            # If we're doing a paired test, exclude donors that do not have a paired case/control sample
-            if paired_test:
-                paired_donors = set(case_donors).intersection(set(control_donors))
-                paired_donors = list(paired_donors)
-                case_donors = paired_donors
-                control_donors = paired_donors
-
-            case_donors.sort()
-            control_donors.sort()
-
-            # We skip loci that do not have enough donors included
-            if len(case_donors) < min_samples or len(control_donors) < min_samples:
-                n_skipped_loci += 1
+            if not unit_ids:
                 continue
 
-            # Create a dict of interruption unit -> status -> donor_id -> count
-            interruptions = defaultdict(
-                lambda: {
-                    "case": {d: 0 for d in case_donors},
-                    "control": {d: 0 for d in control_donors},
-                }
-            )
-
-            intrp_units_to_skip = set()
+            # Calculate p-values and cohen's d for every interruption unit at
+            # once; both tests vectorize over the unit axis
+            if paired_test:
+                _, p_values = scipy.stats.wilcoxon(
+                    case_arr, control_arr, alternative="two-sided", axis=1
+                )
+            elif len(case_donors) > 8 and len(control_donors) > 8:
+                # at these sample sizes method="auto" always uses the normal
+                # approximation, so one batched call gives the same p-values
+                # as testing each unit separately
+                _, p_values = scipy.stats.mannwhitneyu(
+                    case_arr, control_arr, alternative="two-sided", axis=1
+                )
+            else:
+                # for small samples method="auto" picks the exact or
+                # asymptotic test per unit depending on ties, which a single
+                # batched call would decide once for the whole locus; call
+                # per unit to keep the per-unit p-values
+                p_values = np.empty(len(unit_ids))
+                for unit_id in range(len(unit_ids)):
+                    _, p_values[unit_id] = scipy.stats.mannwhitneyu(
+                        case_arr[unit_id], control_arr[unit_id], alternative="two-sided"
+                    )
 
-            # Fill the interruptions dict from the interruption_counts column
-            # which contains info for all interruptions in the locus
-            for entry in row["interruption_counts"].split(","):
-                sample_id, intrpt_unit, count = entry.split(":")
-                donor_id, status = sample_id.split("_")
-                if status not in ["case", "control"]:
-                    raise Exception("Unknown sample status: {}".format(sample_id))
-                elif status == "case" and donor_id not in case_donors:
-                    continue
-                elif status == "control" and donor_id not in control_donors:
-                    continue
+            cohen_d_values = cohen_d(case_arr, control_arr, axis=1)
 
-                count = float(count)
-                if (
-                    pd.isna(count)
-                    or count == float("inf")
-                    or count == float("-inf")
-                    or count < 0
-                ):
-                    intrp_units_to_skip.add(intrpt_unit)
-
-                interruptions[intrpt_unit][status][donor_id] = count
-
-            # For each interruption unit, we calculate the p-value and cohen's d
-            for intrpt_unit, counts in tqdm(
-                interruptions.items(),
-                total=len(interruptions),
+            # For each interruption unit, we calculate the p-value
+            for intrpt_unit, unit_id in tqdm(
+                unit_ids.items(),
+                total=len(unit_ids),
                 desc="Interruptions",
                 position=2,
                 leave=False,
@@ -198,79 +341,55 @@ def main():
                     n_skipped_interruptions += 1
                     continue
 
-                case_counts = [counts["case"][d] for d in case_donors]
-                control_counts = [counts["control"][d] for d in control_donors]
-
-                # calculate p-value
-                if paired_test:
-                    _, p_value = scipy.stats.wilcoxon(
-                        case_counts, control_counts, alternative="two-sided"
-                    )
-                else:
-                    _, p_value = scipy.stats.mannwhitneyu(
-                        case_counts, control_counts, alternative="two-sided"
-                    )
-
-                # Calculate cohen's d
-                cohen_d_value = cohen_d(case_counts, control_counts)
+                p_value = p_values[unit_id]
+                cohen_d_value = cohen_d_values[unit_id]
 
                 if pd.isna(p_value):
                     print(
-                        f"Warning: NaN p-value for {row['locus_id']} and '{intrpt_unit}' interruption. Skipping..."
+                        f"Warning: NaN p-value for {row.locus_id} and '{intrpt_unit}' interruption. Skipping..."
                     )
                     n_skipped_interruptions += 1
                     continue
                 elif pd.isna(cohen_d_value):
                     print(
-                        f"Warning: NaN Cohen's d for {row['locus_id']} and '{intrpt_unit}' interruption. Skipping..."
+                        f"Warning: NaN Cohen's d for {row.locus_id} and '{intrpt_unit}' interruption. Skipping..."
                     )
                     n_skipped_interruptions += 1
                     continue
 
                 # We only output the counts if the p-value is below the cutoff
                 if p_value < p_value_cutoff:
-                    read_counts_str = row["read_counts"]
+                    read_counts_str = row.read_counts
                     interruption_counts_str = []
                     for d in case_donors:
-                        interruption_counts_str.append(f"{d}_case:{counts['case'][d]}")
+                        i = case_idx[d]
+                        count = case_arr[unit_id, i] if case_filled[unit_id, i] else 0
+                        interruption_counts_str.append(f"{d}_case:{count}")
                     for d in control_donors:
-                        interruption_counts_str.append(
-                            f"{d}_control:{counts['control'][d]}"
+                        i = control_idx[d]
+                        count = (
+                            control_arr[unit_id, i] if control_filled[unit_id, i] else 0
                         )
+                        interruption_counts_str.append(f"{d}_control:{count}")
                     interruption_counts_str = ",".join(interruption_counts_str)
                 else:
                     read_counts_str = ""
                     interruption_counts_str = ""
 
-                output.append(
-                    (
-                        row["locus_id"],
-                        row["reference_region"],
-                        row["motif"],
-                        intrpt_unit,
-                        len(case_donors),
-                        len(control_donors),
-                        p_value,
-                        cohen_d_value,
-                        read_counts_str,
-                        interruption_counts_str,
-                    )
-                )
-
-    # create a dataframe from the output
-    output_cols = [
-        "locus_id",
-        "reference_region",
-        "motif",
-        "interruption",
-        "n_case",
-        "n_control",
-        "p_value",
-        "cohen_d",
-        "read_counts",
-        "interruption_counts",
-    ]
-    output_df = pd.DataFrame(output, columns=output_cols)
+                output["locus_id"].append(row.locus_id)
+                output["reference_region"].append(row.reference_region)
+                output["motif"].append(row.motif)
+                output["interruption"].append(intrpt_unit)
+                output["n_case"].append(len(case_donors))
+                output["n_control"].append(len(control_donors))
+                output["p_value"].append(p_value)
+                output["cohen_d"].append(cohen_d_value)
+                output["read_counts"].append(read_counts_str)
+                output["interruption_counts"].append(interruption_counts_str)
+
+    # create a dataframe from the output columns
+    output_cols = list(output)
+    output_df = pd.DataFrame(output)
 
     # sort by p-value
     output_df.sort_values(by=["p_value"], inplace=True, ignore_index=True)